@@ -74,7 +74,8 @@ def fetch_products(name: Optional[str] = None,
             "limit": limit,
             "offset": offset,
             "sort_by_price": sort_by_price,
-            "order": order
+            "order": order,
+            "fields": "card",
         }
         if name:
             params["name"] = name
@@ -1,13 +1,94 @@
-from fastapi import FastAPI, HTTPException, Query, Path,Depends,Request
-from service.products import load_products,get_all_products,add_product,remove_product,change_product
-from schema.product import Product, ProductUpdate
+from fastapi import FastAPI, HTTPException, Query, Path,Depends,Request,Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from service.products import snapshot_page,add_product,remove_product,change_product,query_products,bulk_update_products,get_product
+from service.projection import parse_fields,apply_fields
+from service.changes import change_log
+from service.products import get_catalog_version
+from service.coalesce import catalog_queries
+from service.similar import IndexNotReady,similar_products
+from service.shards import sharded_catalog
+from service.sellers import seller_index
+from middleware.compression import CompressionMiddleware
+from middleware.admission import AdmissionMiddleware,RouteLimiter
+from middleware.profiling import ProfilingMiddleware
+from service.profiling import ProfileStore,profiled
+from schema.product import Product, ProductUpdate, BulkUpdate
 from uuid import uuid4,UUID
 from datetime import datetime
 from typing import Dict,List
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+import hmac
+import json
 import os
 load_dotenv()
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the similarity index is built in the background; /similar answers 503 until it is ready
+    similar_products.start()
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+# per-route concurrency limits; /products/changes is left out because long-polls
+# are expected to sit idle for a while
+route_limiters=[
+    RouteLimiter(
+        "list_products",
+        lambda method,path: method=="GET" and path=="/products",
+        max_concurrent=int(os.getenv("LIST_MAX_CONCURRENT","32")),
+        max_queue=int(os.getenv("LIST_MAX_QUEUE","64")),
+        queue_timeout=float(os.getenv("LIST_QUEUE_TIMEOUT","2")),
+    ),
+    RouteLimiter(
+        "product_detail",
+        lambda method,path: (
+            method=="GET" and path.startswith("/products/")
+            and path!="/products/changes" and not path.endswith("/similar")
+        ),
+        max_concurrent=int(os.getenv("DETAIL_MAX_CONCURRENT","64")),
+        max_queue=int(os.getenv("DETAIL_MAX_QUEUE","128")),
+        queue_timeout=float(os.getenv("DETAIL_QUEUE_TIMEOUT","2")),
+    ),
+    # separate from product_detail so slow neighbour lookups never starve plain detail reads
+    RouteLimiter(
+        "similar_products",
+        lambda method,path: method=="GET" and path.startswith("/products/") and path.endswith("/similar"),
+        max_concurrent=int(os.getenv("SIMILAR_MAX_CONCURRENT","16")),
+        max_queue=int(os.getenv("SIMILAR_MAX_QUEUE","32")),
+        queue_timeout=float(os.getenv("SIMILAR_QUEUE_TIMEOUT","2")),
+    ),
+]
+# opt-in profiling: send "X-Profile: $PROFILE_ADMIN_TOKEN", or sample a fraction of traffic;
+# /admin/profiles takes the same token in "X-Admin-Token" and is never profiled itself
+PROFILE_ADMIN_TOKEN=os.getenv("PROFILE_ADMIN_TOKEN")
+profile_store=ProfileStore(
+    os.getenv("PROFILE_DIR",os.path.join(os.path.dirname(__file__),"profiles")),
+    max_files=int(os.getenv("PROFILE_MAX_FILES","50")),
+    max_bytes=int(os.getenv("PROFILE_MAX_BYTES",str(50*1024*1024))),
+)
+# innermost, so profiles time the handler rather than queueing or compression
+app.add_middleware(
+    ProfilingMiddleware,
+    store=profile_store,
+    admin_token=PROFILE_ADMIN_TOKEN,
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE","0")),
+    exclude_paths=("/admin/profiles",),
+)
+# added before compression so it sits inside it: cached pages never take a slot
+app.add_middleware(AdmissionMiddleware,limiters=route_limiters)
+# /similar is left out of the page cache: the similarity index catches up with a
+# catalog version in the background, so its answer can lag the version key
+app.add_middleware(
+    CompressionMiddleware,
+    cacheable=lambda path: (
+        (path=="/products" or path.startswith(("/products/","/sellers/")))
+        and path!="/products/changes"
+        and not path.endswith("/similar")
+    ),
+)
 
 # @app.middleware("http")
 # async def lifecycle(request: Request,call_next):
@@ -27,9 +108,22 @@ def root(dep=Depends(common_logic)):
     DB_PATH=os.getenv("BASE_URL")
     return {"message": "welcome to fast api","dependencies":dep,"data_path":DB_PATH}
 
+@app.get("/metrics/queues")
+def queue_metrics():
+    return {
+        "routes":{l.name:l.stats() for l in route_limiters},
+        "coalescing":catalog_queries.stats(),
+    }
+
+@app.get("/admin/profiles")
+def list_profiles(x_admin_token: str = Header(default=None)):
+    if not PROFILE_ADMIN_TOKEN or not hmac.compare_digest(x_admin_token or "",PROFILE_ADMIN_TOKEN):
+        raise HTTPException(status_code=403,detail="admin token required")
+    return {"slowest":profile_store.slowest()}
+
 @app.get("/products",response_model=Dict)
+@profiled
 def list_products(   
-    dep=Depends(load_products),
     name: str = Query(
         default=None,
         min_length=1,
@@ -52,27 +146,41 @@ def list_products(
         ge=0,
         description="number of products to skip before starting to collect the result set",
     ),
+    fields: str = Query(
+        default=None,
+        description="comma separated fields to return, or 'card' for the listing card fields (first image only)",
+    ),
 ):
-    products=dep
+    try:
+        parsed_fields=parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400,detail=str(e))
 
-    if name:
-        needle = name.strip().lower()
-        products = [
-            p for p in products
-            if needle in p.get("name", "").lower()
-        ]
+    # identical concurrent queries share one load-filter-sort; pages are sliced per request
+    needle=name.strip().lower() if name else None
+    sort_key=order if sort_by_price else None
+    if sharded_catalog is not None:
+        # shards only return the requested page, so the page is part of the key
+        total,products=catalog_queries.do(
+            ("list",needle,sort_key,offset,limit,get_catalog_version()),
+            lambda: sharded_catalog.query(needle,sort_by_price,order,offset,limit),
+        )
+    else:
+        products=catalog_queries.do(
+            ("list",needle,sort_key,get_catalog_version()),
+            lambda: query_products(needle,sort_by_price,order),
+        )
+        total = len(products)
+        products = [p.to_dict() for p in products[offset:offset+limit]]
 
-    if not products:
+    if not total:
         raise HTTPException(
             status_code=404,
             detail="no products found matching the search criteria"
         )
-    if sort_by_price:
-        reverse=order=="desc"
-        products=sorted(products,key=lambda p:p.get("price",0),reverse=reverse)
 
-    total = len(products)
-    products = products[offset:offset+limit]
+    if parsed_fields:
+        products=apply_fields(products,parsed_fields)
 
     return {
         "total": total,
@@ -80,7 +188,93 @@ def list_products(
         "items": products
     }
 
+SSE_KEEPALIVE_SECONDS=15
+
+async def change_events(since:int,epoch:str):
+    while True:
+        if not await change_log.wait(since,SSE_KEEPALIVE_SECONDS,epoch):
+            change_log.sync_version(get_catalog_version())
+            yield ": keepalive\n\n"
+            continue
+        change_log.sync_version(get_catalog_version())
+        batch=change_log.since(since,epoch)
+        if batch["reset"]:
+            yield f"event: reset\ndata: {json.dumps(batch)}\n\n"
+            return
+        for change in batch["changes"]:
+            yield f"id: {change['seq']}\nevent: change\ndata: {json.dumps(change)}\n\n"
+        since=batch["seq"]
+
+# async on purpose: idle long-polls and SSE streams wait on the event loop
+# instead of holding threads from the pool the sync routes run on
+# the feed lives in this process's memory, so it is only coherent with a single
+# uvicorn worker; see ChangeLog
+#
+# bootstrap: a request without a cursor (since=0), or with one that aged out,
+# gets reset=true, the seq/epoch to resume from and the first `limit` products
+# of a snapshot in id order. Fetch the rest with snapshot_after=<next_after>
+# until next_after is null, then poll with since=<seq>. Every change carries the
+# full product, so replaying ones a later snapshot page already showed is harmless
+@app.get("/products/changes")
+async def list_changes(
+    request: Request,
+    since: int = Query(
+        default=0,
+        ge=0,
+        description="last sequence number the client has applied; 0 (no cursor) starts with a snapshot",
+    ),
+    epoch: str = Query(
+        default=None,
+        description="epoch returned with that sequence number; a mismatch forces a resync",
+    ),
+    wait: float = Query(
+        default=0,
+        ge=0,
+        le=60,
+        description="long-poll: seconds to wait for changes when there are none yet",
+    ),
+    limit: int = Query(
+        default=500,
+        ge=1,
+        le=5000,
+        description="maximum number of changes, or of snapshot products, to return",
+    ),
+    snapshot_after: str = Query(
+        default=None,
+        description="continue a snapshot after this product id (next_after of the previous page)",
+    ),
+    stream: bool = Query(
+        default=False,
+        description="stream changes as server-sent events instead of returning a batch",
+    ),
+):
+    # EventSource reconnects send the last seen id back in this header
+    last_event_id=request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since=int(last_event_id)
+
+    change_log.sync_version(get_catalog_version())
+    if snapshot_after is not None:
+        items,next_after=await run_in_threadpool(snapshot_page,snapshot_after,limit)
+        # a changed epoch means an outside write mid-snapshot: start over with since=0
+        return {"epoch":change_log.epoch,"items":items,"next_after":next_after}
+
+    epoch=epoch or change_log.epoch
+    if stream:
+        return StreamingResponse(change_events(since,epoch),media_type="text/event-stream")
+
+    if wait:
+        await change_log.wait(since,wait,epoch)
+        change_log.sync_version(get_catalog_version())
+    batch=change_log.since(since,epoch,limit)
+    if batch["reset"]:
+        # no cursor, or it aged out (or server restarted): start a snapshot.
+        # seq is read first, so replaying from it may repeat a change already in items
+        batch["items"],batch["next_after"]=await run_in_threadpool(snapshot_page,None,limit)
+    return batch
+
 @app.get("/products/{product_id}",response_model=Dict)
+@profiled
 def get_product_id(
     product_id: str= Path(
         ...,
@@ -88,16 +282,109 @@ def get_product_id(
         max_length=36,
         description="UUID of the products",
         examples=["394d40e7-2a95-445d-8738-c6af6be5a97e"],
-    )
+    ),
+    fields: str = Query(
+        default=None,
+        description="comma separated fields to return, or 'card' for the listing card fields (first image only)",
+    ),
 ):
-    products= get_all_products()
-    for product in products :
-        if product["id"]==product_id:
-            return product
-    raise HTTPException(status_code=404,detail="Product not found!")
+    try:
+        parsed_fields=parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400,detail=str(e))
+    record=get_product(product_id)
+    if record is None:
+        raise HTTPException(status_code=404,detail="Product not found!")
+    product=record.to_dict()
+    if parsed_fields:
+        return apply_fields([product],parsed_fields)[0]
+    return product
+
+
+@app.get("/products/{product_id}/similar",response_model=Dict)
+@profiled
+def get_similar_products(
+    product_id: str= Path(
+        ...,
+        min_length=36,
+        max_length=36,
+        description="UUID of the product to find neighbours for",
+    ),
+    k: int = Query(
+        default=5,
+        ge=1,
+        le=similar_products.k,
+        description="number of similar products to return",
+    ),
+    fields: str = Query(
+        default=None,
+        description="comma separated fields to return, or 'card' for the listing card fields (first image only)",
+    ),
+):
+    try:
+        parsed_fields=parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400,detail=str(e))
+    try:
+        neighbours=similar_products.similar(product_id,k)
+    except IndexNotReady as e:
+        raise HTTPException(status_code=503,detail=str(e),headers={"Retry-After":"5"})
+    if neighbours is None:
+        raise HTTPException(status_code=404,detail="Product not found!")
+    items=[product for product,_ in neighbours]
+    if parsed_fields:
+        items=apply_fields(items,parsed_fields)
+    items=[dict(item,similarity=score) for item,(_,score) in zip(items,neighbours)]
+    return {"id":product_id,"items":items}
+
+
+@app.get("/sellers/{seller_id}/summary",response_model=Dict)
+@profiled
+def get_seller_summary(seller_id: UUID= Path(...,description="Seller UUID")):
+    summary=seller_index.summary(str(seller_id))
+    if summary is None:
+        raise HTTPException(status_code=404,detail="Seller not found!")
+    return summary
+
+@app.get("/sellers/{seller_id}/products",response_model=Dict)
+@profiled
+def list_seller_products(
+    seller_id: UUID= Path(...,description="Seller UUID"),
+    limit :int = Query(
+        default=10,
+        ge=1,
+        le=100,
+        description="maximum number of products to return",
+    ),
+    offset:int = Query(
+        default=0,
+        ge=0,
+        description="number of products to skip before starting to collect the result set",
+    ),
+    fields: str = Query(
+        default=None,
+        description="comma separated fields to return, or 'card' for the listing card fields (first image only)",
+    ),
+):
+    try:
+        parsed_fields=parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400,detail=str(e))
+    products=seller_index.products(str(seller_id))
+    if products is None:
+        raise HTTPException(status_code=404,detail="Seller not found!")
+    items=[p.to_dict() for p in products[offset:offset+limit]]
+    if parsed_fields:
+        items=apply_fields(items,parsed_fields)
+    return {
+        "total": len(products),
+        "limit": limit,
+        "items": items
+    }
 
 
 @app.post("/products",status_code=201)
+@profiled
 def create_product(product: Product):
     product_dict=product.model_dump(mode="json")
     
@@ -109,7 +396,19 @@ def create_product(product: Product):
         raise HTTPException(status_code=400,detail=str(e))
     return product.model_dump(mode="json")
 
+@app.post("/products/bulk-update")
+@profiled
+def bulk_update(payload: BulkUpdate):
+    try:
+        return bulk_update_products(
+            payload.filter.model_dump(mode="json",exclude_none=True),
+            payload.operation.model_dump(exclude_none=True),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400,detail=str(e))
+
 @app.delete("/products/{product_id}")
+@profiled
 def delete_product(product_id:UUID= Path(...,description="Product_id")): 
     try:
         res=remove_product(str(product_id))
@@ -119,6 +418,7 @@ def delete_product(product_id:UUID= Path(...,description="Product_id")):
     
 
 @app.put("/products/{product_id}")
+@profiled
 def update_product(product_id:UUID= Path(...,description="Product UUID"),
                    payload:ProductUpdate=...,
                    ):
@@ -0,0 +1,158 @@
+import gzip
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+from service.products import get_catalog_version
+
+MIN_SIZE = 500
+
+# requests asking to be profiled must reach the handler, and a profiled
+# response carries a per-request id that must not be replayed to others
+BYPASS_CACHE_HEADER = b"x-profile"
+UNCACHEABLE_RESPONSE_HEADER = b"x-profile-id"
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    offered = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        offered[token.strip().lower()] = q
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+class CompressionMiddleware:
+    """gzip/brotli for JSON responses, with a body cache for hot GET pages.
+
+    For paths accepted by `cacheable`, the compressed body is cached under
+    (path, query, encoding, catalog version). A repeat request for the same
+    page is answered from the cache without running the handler at all;
+    any write to products.json changes the version and so misses the cache.
+    """
+
+    def __init__(
+        self,
+        app,
+        cacheable: Callable[[str], bool] = lambda path: False,
+        max_entries: int = 256,
+        min_size: int = MIN_SIZE,
+    ):
+        self.app = app
+        self.cacheable = cacheable
+        self.max_entries = max_entries
+        self.min_size = min_size
+        self._cache: "OrderedDict[Tuple, Tuple[int, List, bytes]]" = OrderedDict()
+        self._lock = Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        cache_key = None
+        if scope["method"] == "GET" and BYPASS_CACHE_HEADER not in headers and self.cacheable(scope["path"]):
+            cache_key = (scope["path"], scope.get("query_string", b""), encoding, get_catalog_version())
+            hit = self._get(cache_key)
+            if hit is not None:
+                status, response_headers, body = hit
+                await send({"type": "http.response.start", "status": status, "headers": response_headers})
+                await send({"type": "http.response.body", "body": body})
+                return
+
+        start_message: Dict = {}
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def buffered_send(message):
+            nonlocal passthrough
+            if message["type"] == "http.response.start":
+                start_message.update(message)
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+            if not chunks and message.get("more_body") and not self._is_json(start_message):
+                # streamed / non-JSON bodies (e.g. server-sent events) go out untouched
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body"):
+                return
+            await self._finish(start_message, b"".join(chunks), encoding, cache_key, send)
+
+        await self.app(scope, receive, buffered_send)
+
+    async def _finish(self, start_message: Dict, body: bytes, encoding: str, cache_key, send):
+        headers = [
+            (k, v) for k, v in start_message.get("headers", [])
+            if k.lower() not in (b"content-length", b"content-encoding")
+        ]
+        status = start_message.get("status", 200)
+        already_encoded = any(k.lower() == b"content-encoding" for k, _ in start_message.get("headers", []))
+        if already_encoded or len(body) < self.min_size or not self._is_json(start_message):
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        body = compress(body, encoding)
+        headers += [
+            (b"content-encoding", encoding.encode()),
+            (b"content-length", str(len(body)).encode()),
+            (b"vary", b"Accept-Encoding"),
+        ]
+        if cache_key is not None and status == 200 and not any(k.lower() == UNCACHEABLE_RESPONSE_HEADER for k, _ in headers):
+            self._put(cache_key, (status, headers, body))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    def _is_json(start_message: Dict) -> bool:
+        for key, value in start_message.get("headers", []):
+            if key.lower() == b"content-type":
+                return value.startswith(b"application/json")
+        return False
+
+    def _get(self, key):
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+            return hit
+
+    def _put(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
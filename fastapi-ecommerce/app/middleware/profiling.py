@@ -0,0 +1,76 @@
+import asyncio
+import hmac
+import random
+import time
+from datetime import datetime
+from typing import Iterable, Optional
+from uuid import uuid4
+
+from service.profiling import ProfileStore, RequestProfile, start_profile, stop_profile
+
+PROFILE_HEADER = b"x-profile"
+
+
+class ProfilingMiddleware:
+    """Opt-in per-request profiling.
+
+    A request is profiled when it carries `X-Profile: <admin token>` or,
+    independently, with probability `sample_rate`. Handlers decorated with
+    `service.profiling.profiled` then run under cProfile, the service layer
+    records its phase timings, and the result is saved to `store`. The
+    response of a profiled request carries an `X-Profile-Id` header.
+
+    Paths in `exclude_paths` (the profile admin endpoint) are never profiled,
+    and a request whose handler is not decorated leaves nothing behind.
+    """
+
+    def __init__(
+        self,
+        app,
+        store: ProfileStore,
+        admin_token: Optional[str] = None,
+        sample_rate: float = 0.0,
+        exclude_paths: Iterable[str] = (),
+    ):
+        self.app = app
+        self.store = store
+        self.admin_token = admin_token
+        self.sample_rate = sample_rate
+        self.exclude_paths = frozenset(exclude_paths)
+
+    def _wants_profile(self, scope) -> bool:
+        if self.admin_token:
+            for key, value in scope.get("headers") or []:
+                if key == PROFILE_HEADER:
+                    return hmac.compare_digest(value.decode("latin-1"), self.admin_token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid4().hex[:8]}"
+        profile = RequestProfile(
+            profile_id,
+            scope["method"],
+            scope["path"],
+            scope.get("query_string", b"").decode("latin-1"),
+        )
+
+        async def tagged_send(message):
+            # only handlers decorated with @profiled ever run under the profiler
+            if message["type"] == "http.response.start" and "handler" in profile.phases:
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        token = start_profile(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, tagged_send)
+        finally:
+            profile.total = time.perf_counter() - start
+            stop_profile(token)
+            if "handler" in profile.phases:
+                await asyncio.to_thread(self.store.save, profile)
@@ -234,3 +234,40 @@ class ProductUpdate(BaseModel):
             return round(self.price * (1 - self.discount_percent / 100), 2)
         return None
 
+
+###bulk update pydantic
+class BulkFilter(BaseModel):
+    category: Optional[str] = None
+    brand: Optional[str] = None
+    seller_id: Optional[UUID] = None
+    tag: Optional[str] = None
+    min_price: Optional[float] = Field(default=None, ge=0)
+    max_price: Optional[float] = Field(default=None, gt=0)
+
+    @model_validator(mode="after")
+    @classmethod
+    def validate_filter(cls, model: "BulkFilter"):
+        if not model.model_dump(exclude_none=True):
+            raise ValueError("filter needs at least one criterion")
+        if model.min_price is not None and model.max_price is not None and model.min_price > model.max_price:
+            raise ValueError("min_price must not exceed max_price")
+        return model
+
+class BulkOperation(BaseModel):
+    set_price: Optional[float] = Field(default=None, gt=0)
+    scale_price: Optional[float] = Field(default=None, gt=0, description="multiply price, e.g. 0.9 for -10%")
+    discount_percent: Optional[int] = Field(default=None, ge=0, le=90)
+    is_active: Optional[bool] = None
+
+    @model_validator(mode="after")
+    @classmethod
+    def validate_operation(cls, model: "BulkOperation"):
+        if model.set_price is not None and model.scale_price is not None:
+            raise ValueError("use either set_price or scale_price, not both")
+        if not model.model_dump(exclude_none=True):
+            raise ValueError("operation needs at least one change")
+        return model
+
+class BulkUpdate(BaseModel):
+    filter: BulkFilter
+    operation: BulkOperation
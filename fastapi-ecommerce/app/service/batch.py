@@ -0,0 +1,159 @@
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from service.products import DATA_FILE, change_products
+
+# a transform gets one product and its own rng and returns the fields to
+# change, or None to leave the product alone
+Transform = Callable[[Dict, random.Random], Optional[Dict]]
+
+READ_SIZE = 64 * 1024
+# one product may span this many reads; past that the file is treated as malformed
+MAX_RECORD_READS = 16
+
+
+def iter_products(path: Path = DATA_FILE, read_size: int = READ_SIZE) -> Iterator[Dict]:
+    """Yield products from a JSON array file one at a time.
+
+    Only the product being decoded and one read buffer are held in memory,
+    so the scan stays flat however large the catalog grows. A product that
+    still does not decode after MAX_RECORD_READS reads raises a ValueError
+    with its character position instead of pulling in the rest of the file.
+    """
+    decoder = json.JSONDecoder()
+    max_buffer = MAX_RECORD_READS * read_size
+    with open(path, "r", encoding="utf-8") as f:
+        # characters of the file before buffer[0], for error positions
+        offset = 0
+        buffer = ""
+        while not buffer:
+            chunk = f.read(read_size)
+            if not chunk:
+                return
+            buffer = chunk.lstrip()
+            offset += len(chunk) - len(buffer)
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array")
+        buffer = buffer[1:]
+        offset += 1
+        eof = False
+        while True:
+            stripped = buffer.lstrip(" \t\r\n,")
+            offset += len(buffer) - len(stripped)
+            buffer = stripped
+            if buffer.startswith("]"):
+                return
+            error = None
+            if buffer:
+                try:
+                    product, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError as e:
+                    error = e  # usually a product split across reads, fetch more below
+                else:
+                    yield product
+                    buffer = buffer[end:]
+                    offset += end
+                    continue
+            if error is not None and (eof or len(buffer) > max_buffer):
+                raise ValueError(f"{path}: cannot decode the product at character {offset + error.pos}: {error.msg}")
+            if eof:
+                raise ValueError(f"{path} ended before the closing ']'")
+            chunk = f.read(read_size)
+            eof = not chunk
+            buffer += chunk
+
+
+def iter_chunks(products: Iterator[Dict], chunk_size: int) -> Iterator[List[Dict]]:
+    while True:
+        chunk = list(islice(products, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def product_rng(seed: Optional[int], product_id: str) -> random.Random:
+    # seeding per product (not per run) keeps results identical no matter how
+    # the catalog is chunked or how many workers pick the chunks up
+    if seed is None:
+        return random.Random()
+    return random.Random(f"{seed}:{product_id}")
+
+
+def run_chunk(transform: Transform, seed: Optional[int], chunk: List[Dict]) -> List[Tuple[str, Dict]]:
+    updates = []
+    for product in chunk:
+        changes = transform(product, product_rng(seed, product["id"]))
+        if not changes:
+            continue
+        changes = {k: v for k, v in changes.items() if product.get(k) != v}
+        if changes:
+            updates.append((product["id"], changes))
+    return updates
+
+
+def run_batch_job(
+    transform: Transform,
+    seed: Optional[int] = None,
+    dry_run: bool = False,
+    workers: Optional[int] = None,
+    chunk_size: int = 500,
+    sample_size: int = 10,
+) -> Dict:
+    """Stream products.json through `transform` on a process pool.
+
+    The scan holds one read buffer and a bounded number of chunks. A dry
+    run only counts the changes and keeps the first `sample_size` of them.
+    A real run collects the changed products and commits them in a single
+    write through the products service, which takes the same lock as the
+    API so concurrent writers are not clobbered. That write loads and saves
+    the whole catalog, so the commit step is O(catalog), not streaming.
+    `transform` must be a module-level function so it can be pickled.
+    """
+    job = partial(run_chunk, transform, seed)
+    workers = workers or os.cpu_count() or 1
+    scanned = 0
+    changed = 0
+    sample: List[Tuple[str, Dict]] = []
+    updates: Dict[str, Dict] = {}
+
+    def collect(chunk_updates: List[Tuple[str, Dict]]) -> None:
+        nonlocal changed
+        changed += len(chunk_updates)
+        if dry_run:
+            sample.extend(chunk_updates[:sample_size - len(sample)])
+        else:
+            updates.update(chunk_updates)
+
+    def counted(products: Iterator[Dict]) -> Iterator[Dict]:
+        nonlocal scanned
+        for product in products:
+            scanned += 1
+            yield product
+
+    chunks = iter_chunks(counted(iter_products(DATA_FILE)), chunk_size)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # bound the number of chunks in flight so memory does not grow with the file
+        in_flight = []
+        for chunk in chunks:
+            in_flight.append(pool.submit(job, chunk))
+            if len(in_flight) >= 2 * workers:
+                collect(in_flight.pop(0).result())
+        for future in in_flight:
+            collect(future.result())
+
+    committed = 0
+    if updates and not dry_run:
+        committed = len(change_products(updates))
+    return {
+        "scanned": scanned,
+        "changed": changed,
+        "committed": committed,
+        "dry_run": dry_run,
+        "sample": dict(sample) if dry_run else None,
+    }
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+# (op, before, after) - before is None for "add", after is None for "delete"
+Change = Tuple[str, Optional[Dict], Optional[Dict]]
+# listener(changes) - called once per write with every product that write touched
+Listener = Callable[[List[Change]], None]
+
+
+class ChangeLog:
+    """Bounded, sequence-numbered log of catalog mutations.
+
+    Every write through service/products.py appends one entry per touched
+    product. Clients keep the last `seq` they applied and ask for what came
+    after it; if they have no cursor yet (seq 0), or it has fallen off the
+    end of the log (or the log was restarted, which changes `epoch`), they
+    get told to resnapshot.
+
+    The log only sees writes made by this process. If products.json is
+    rewritten by someone else, the next read notices the catalog version
+    moved and starts a new epoch, so every client resyncs from a snapshot.
+
+    Because of that the feed needs a single API process: under
+    `uvicorn --workers N` every worker keeps its own log, seq and epoch, a
+    client is bounced between them, and each write made by one worker looks
+    like an outside write to all the others. Run the API with one worker
+    (scale the read routes separately) when /products/changes is in use.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: deque = deque(maxlen=max_entries)
+        # since=0 means "no cursor", so the first cursor handed out is 1
+        self._seq = 1
+        self._lock = threading.Lock()
+        self._listeners: List[Listener] = []
+        # (event loop, asyncio.Event) of long-polls and SSE streams waiting for news
+        self._async_waiters = set()
+        self._version = None
+        # version a write of ours is swapping in but has not recorded yet
+        self._expected = None
+        self.epoch = str(uuid4())
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def subscribe(self, listener: Listener) -> None:
+        self._listeners.append(listener)
+
+    def record(self, op: str, product_id: str, before: Optional[Dict], after: Optional[Dict], version=None) -> int:
+        return self.record_many([(op, product_id, before, after)], version)
+
+    def record_many(self, changes: List[Tuple[str, str, Optional[Dict], Optional[Dict]]], version=None) -> int:
+        """Append one entry per (op, product_id, before, after) of a single write."""
+        with self._lock:
+            at = datetime.utcnow().isoformat() + "Z"
+            for op, product_id, _, after in changes:
+                self._seq += 1
+                self._entries.append({
+                    "seq": self._seq,
+                    "op": op,
+                    "id": product_id,
+                    "product": after,
+                    "at": at,
+                })
+            if version is not None:
+                self._version = version
+                self._expected = None
+            self._wake()
+            seq = self._seq
+        batch = [(op, before, after) for op, _, before, after in changes]
+        for listener in self._listeners:
+            listener(batch)
+        return seq
+
+    def expect_version(self, version) -> None:
+        """Announce the catalog version a write of ours is about to swap in.
+
+        Called before the file is replaced, so `sync_version` running between
+        the swap and `record` does not mistake that write for an outside one.
+        """
+        with self._lock:
+            self._expected = version
+
+    def sync_version(self, version) -> None:
+        # a version we did not write ourselves means an outside writer touched the file
+        with self._lock:
+            if self._version is None:
+                self._version = version
+            elif version != self._version and version != self._expected:
+                self._version = version
+                self._entries.clear()
+                self.epoch = str(uuid4())
+                self._wake()
+
+    def since(self, seq: int, epoch: Optional[str] = None, limit: int = 500) -> Dict:
+        with self._lock:
+            oldest = self._entries[0]["seq"] if self._entries else self._seq + 1
+            if seq <= 0 or (epoch is not None and epoch != self.epoch) or seq > self._seq or seq < oldest - 1:
+                return {"epoch": self.epoch, "seq": self._seq, "reset": True, "changes": []}
+            changes = [e for e in self._entries if e["seq"] > seq][:limit]
+            last = changes[-1]["seq"] if changes else seq
+            return {
+                "epoch": self.epoch,
+                "seq": last,
+                "reset": False,
+                "has_more": last < self._seq,
+                "changes": changes,
+            }
+
+    def _ready(self, seq: int, epoch: Optional[str]) -> bool:
+        return self._seq > seq or (epoch is not None and epoch != self.epoch)
+
+    def _wake(self) -> None:
+        # called under self._lock, usually from a threadpool writer
+        for loop, event in self._async_waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    async def wait(self, seq: int, timeout: float, epoch: Optional[str] = None) -> bool:
+        """Wait until there is something after `seq` (or the epoch changed).
+
+        Parks the coroutine on an asyncio.Event rather than a threadpool thread.
+        """
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            if self._ready(seq, epoch):
+                return True
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._async_waiters.discard(waiter)
+        with self._lock:
+            return self._ready(seq, epoch)
+
+
+change_log = ChangeLog()
@@ -0,0 +1,165 @@
+import json
+from typing import Dict, Iterable, List
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib json module is the fallback
+    orjson = None
+
+# products.json and schema/product.py name three things differently:
+#   on disk              schema (Product / ProductUpdate)
+#   image_urls           image_url
+#   dimensions_cm        dimension
+#   seller.seller_id     seller.id
+# Records always use the on-disk names; the schema names are accepted when
+# decoding so products written by older versions of create_product still load.
+
+
+class SellerRecord:
+    __slots__ = ("seller_id", "name", "email", "website")
+
+    def __init__(self, seller_id, name, email, website):
+        self.seller_id = seller_id
+        self.name = name
+        self.email = email
+        self.website = website
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "SellerRecord":
+        return cls(d.get("seller_id", d.get("id")), d.get("name"), d.get("email"), d.get("website"))
+
+    def to_dict(self) -> Dict:
+        return {"seller_id": self.seller_id, "name": self.name, "email": self.email, "website": self.website}
+
+
+class DimensionsRecord:
+    __slots__ = ("length", "width", "height")
+
+    def __init__(self, length, width, height):
+        self.length = length
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "DimensionsRecord":
+        return cls(d.get("length"), d.get("width"), d.get("height"))
+
+    def to_dict(self) -> Dict:
+        return {"length": self.length, "width": self.width, "height": self.height}
+
+
+class ProductRecord:
+    """One stored product as a compact typed record.
+
+    Attribute access replaces `.get()` walks over raw dicts on the read path.
+    No validation happens here: records are only produced from data that was
+    validated by the pydantic models when it was written.
+    """
+
+    __slots__ = (
+        "id", "sku", "name", "description", "category", "brand", "price",
+        "currency", "discount_percent", "stock", "is_active", "rating", "tags",
+        "image_urls", "dimensions_cm", "seller", "created_at", "extra",
+    )
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "ProductRecord":
+        r = cls.__new__(cls)
+        r.id = d["id"]
+        r.sku = d.get("sku")
+        r.name = d.get("name", "")
+        r.description = d.get("description")
+        r.category = d.get("category")
+        r.brand = d.get("brand")
+        r.price = d.get("price", 0)
+        r.currency = d.get("currency", "INR")
+        r.discount_percent = d.get("discount_percent", 0)
+        r.stock = d.get("stock", 0)
+        r.is_active = d.get("is_active", False)
+        r.rating = d.get("rating", 0)
+        r.tags = d.get("tags")
+        r.image_urls = d.get("image_urls", d.get("image_url"))
+        dims = d.get("dimensions_cm", d.get("dimension"))
+        r.dimensions_cm = DimensionsRecord.from_dict(dims) if dims else None
+        seller = d.get("seller")
+        r.seller = SellerRecord.from_dict(seller) if seller else None
+        r.created_at = d.get("created_at")
+        r.extra = None
+        if not d.keys() <= _KNOWN_KEYS:
+            r.extra = {k: d[k] for k in d.keys() - _KNOWN_KEYS}
+        return r
+
+    def to_dict(self) -> Dict:
+        """The API shape, as a fresh dict the caller may mutate.
+
+        This is the on-disk shape plus the derived `final_price`, which
+        `encode_products` leaves out again.
+        """
+        d = {
+            "id": self.id,
+            "sku": self.sku,
+            "name": self.name,
+            "description": self.description,
+            "category": self.category,
+            "brand": self.brand,
+            "price": self.price,
+            "currency": self.currency,
+            "discount_percent": self.discount_percent,
+            "final_price": final_price(self.price, self.discount_percent),
+            "stock": self.stock,
+            "is_active": self.is_active,
+            "rating": self.rating,
+            "tags": list(self.tags) if self.tags is not None else None,
+            "image_urls": list(self.image_urls) if self.image_urls is not None else None,
+            "dimensions_cm": self.dimensions_cm.to_dict() if self.dimensions_cm else None,
+            "seller": self.seller.to_dict() if self.seller else None,
+            "created_at": self.created_at,
+        }
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+
+# final_price is derived on read, so a value stored by older versions is dropped
+_KNOWN_KEYS = frozenset(ProductRecord.__slots__) - {"extra"} | {"image_url", "dimension", "final_price"}
+
+
+def final_price(price, discount_percent) -> float:
+    # same formula as the Product.final_price computed field
+    return round(price * (1 - discount_percent / 100), 2)
+
+
+def from_schema(product: Dict) -> Dict:
+    """Map a `Product.model_dump(mode="json")` dict onto the on-disk field names."""
+    return ProductRecord.from_dict(product).to_dict()
+
+
+def update_to_storage(update_data: Dict) -> Dict:
+    """Rename `ProductUpdate` fields to their on-disk names for `change_product`."""
+    update = dict(update_data)
+    if "image_url" in update:
+        update["image_urls"] = update.pop("image_url")
+    if "dimension" in update:
+        dims = update.pop("dimension")
+        if dims is not None:
+            dims = {k: v for k, v in dims.items() if k != "volume_cm3"}
+        update["dimensions_cm"] = dims
+    seller = update.get("seller")
+    if isinstance(seller, Dict) and "id" in seller:
+        seller = dict(seller)
+        seller["seller_id"] = seller.pop("id")
+        update["seller"] = seller
+    return update
+
+
+def decode_products(raw: bytes) -> List[ProductRecord]:
+    data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    from_dict = ProductRecord.from_dict
+    return [from_dict(d) for d in data]
+
+
+def encode_products(products: Iterable[Dict]) -> bytes:
+    products = [{k: v for k, v in p.items() if k != "final_price"} for p in products]
+    if orjson is not None:
+        return orjson.dumps(products, option=orjson.OPT_INDENT_2)
+    return json.dumps(products, indent=2, ensure_ascii=False).encode("utf-8")
@@ -1,53 +1,303 @@
-import json
+import os
+import threading
+from bisect import bisect_right
+from contextlib import contextmanager
+from copy import deepcopy
 from pathlib import Path
-from typing import List,Dict
+from typing import List,Dict,Optional,Tuple
+
+import numpy as np
+
+from service.changes import change_log
+from service.codec import ProductRecord,decode_products,encode_products,final_price,from_schema,update_to_storage
+from service.profiling import phase
+
+try:
+    import fcntl
+except ImportError:  # windows: fall back to the in-process lock only
+    fcntl=None
 
 DATA_FILE=Path(__file__).parent.parent / "data" / "products.json"
+LOCK_FILE=DATA_FILE.with_suffix(".lock")
+
+# serialises writers inside this process (API threads) and, through the lock
+# file, across processes (API workers, batch jobs like update_images.py)
+_write_lock=threading.Lock()
+
+@contextmanager
+def write_lock():
+    with _write_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(LOCK_FILE,"a") as lock:
+            fcntl.flock(lock,fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock,fcntl.LOCK_UN)
+
+# decoded records of the current products.json, re-read only when the file changes
+_records=((None,),[],{})
+_records_lock=threading.Lock()
+
+def load_records() -> List[ProductRecord]:
+    """Typed records for the whole catalog, decoded once per catalog version.
+
+    The list and the records are shared between requests: treat them as read-only.
+    """
+    global _records
+    version=get_catalog_version()
+    cached_version,records,_=_records
+    if cached_version==version:
+        return records
+    with _records_lock:
+        if _records[0]==version:
+            return _records[1]
+        if not DATA_FILE.exists():
+            records=[]
+        else:
+            with phase("load"):
+                records=decode_products(DATA_FILE.read_bytes())
+        _records=(version,records,{r.id:r for r in records})
+        return records
+
+def get_product(product_id:str) -> ProductRecord:
+    load_records()
+    return _records[2].get(product_id)
+
+# ids of the current catalog in sorted order, for paging through snapshots
+_snapshot_ids=((None,),[])
+
+def snapshot_page(after_id:Optional[str],limit:int)->Tuple[List[Dict],Optional[str]]:
+    """One page of the catalog in id order, starting after `after_id`.
+
+    Returns the page and the id to continue after (None on the last page).
+    Id order does not shift when products are added or removed between
+    pages, so a client paging through while replaying the change feed from
+    where it started still ends up with every product.
+    """
+    global _snapshot_ids
+    load_records()
+    version,_,by_id=_records
+    if _snapshot_ids[0]!=version:
+        _snapshot_ids=(version,sorted(by_id))
+    ids=_snapshot_ids[1]
+    start=bisect_right(ids,after_id) if after_id else 0
+    page=ids[start:start+limit]
+    next_after=page[-1] if start+limit<len(ids) else None
+    return [by_id[i].to_dict() for i in page],next_after
+
 def load_products() -> List[Dict]:
-    if not DATA_FILE.exists():
-        return []
-    with open(DATA_FILE,"r",encoding="utf-8") as file:
-        return json.load(file)
+    # fresh dicts every call, so callers (the write path) are free to mutate them
+    return [r.to_dict() for r in load_records()]
 def get_all_products() -> List[dict]:
     return load_products()
 
 
 def save_product(products: List[Dict])-> None:
-    with open(DATA_FILE,"w",encoding="utf-8") as f:
-        json.dump(products,f,indent=2,ensure_ascii=False)
+    # write to a temp file and swap it in so readers never see a half-written catalog
+    tmp_file=DATA_FILE.with_suffix(".json.tmp")
+    tmp_file.write_bytes(encode_products(products))
+    # a rename keeps inode, mtime and size, so this is the version the swap produces;
+    # announced first so a change-feed read in between doesn't take it for an outside write
+    change_log.expect_version(_version_of(tmp_file))
+    os.replace(tmp_file,DATA_FILE)
+
 
+##list
+def query_products(name:str=None,sort_by_price:bool=False,order:str="asc")->List[ProductRecord]:
+    products=load_records()
+    if name:
+        needle=name.strip().lower()
+        with phase("scan"):
+            products=[
+                p for p in products
+                if needle in p.name.lower()
+            ]
+    if sort_by_price:
+        reverse=order=="desc"
+        with phase("sort"):
+            products=sorted(products,key=lambda p:p.price,reverse=reverse)
+    return products
+
+
+def _apply_update(product: Dict,update_data: Dict)->Dict:
+    for key,value in update_data.items():
+        if value is None:
+            continue
+
+        if isinstance(value,Dict) and isinstance(product.get(key),Dict):
+            product[key].update(value)
+        else:
+            product[key]=value
+    # derived, never stored: keep the dict handed back to callers and the change feed in step
+    product["final_price"]=final_price(product.get("price",0),product.get("discount_percent",0))
+    return product
+
+def _begin_write()->List[Dict]:
+    # called under write_lock: notice any write made outside this process before ours
+    change_log.sync_version(get_catalog_version())
+    return get_all_products()
+
+def _record(op:str,product_id:str,before,after)->None:
+    change_log.record(op,product_id,before,after,version=get_catalog_version())
+
+def _record_updates(changed: List[tuple])->None:
+    # one log call per write, so listeners can handle the whole batch at once
+    change_log.record_many(
+        [("update",product["id"],before,product) for before,product in changed],
+        version=get_catalog_version(),
+    )
 
 ##add
 def add_product(product: Dict)->Dict :
-    products=get_all_products()
-    if any(p.get("sku")==product.get("sku") for p in products):
-        raise ValueError("SKU alreaddy exist")
-    products.append(product)
-    save_product(products)
-    return product
+    product=from_schema(product)
+    with write_lock():
+        products=_begin_write()
+        if any(p.get("sku")==product.get("sku") for p in products):
+            raise ValueError("SKU alreaddy exist")
+        products.append(product)
+        save_product(products)
+        _record("add",product["id"],None,product)
+        return product
 ##delete
 def remove_product(id:str)-> str:
-    products=get_all_products()
-    for idx ,p in enumerate(products):
-        if p["id"]==str(id):
-            deleted=products.pop(idx)
-            save_product(products)
-            return {"message":"Product deleted succesfully","data":deleted}
+    with write_lock():
+        products=_begin_write()
+        for idx ,p in enumerate(products):
+            if p["id"]==str(id):
+                deleted=products.pop(idx)
+                save_product(products)
+                _record("delete",deleted["id"],deleted,None)
+                return {"message":"Product deleted succesfully","data":deleted}
 
 ##update
 def change_product(product_id:str,update_data: Dict):
-    products=get_all_products()
-    for index,product in enumerate(products):
-        if product["id"]==product_id:
-            for key,value in update_data.items():
-                if value is None:
-                    continue
-                
-                if isinstance(value,Dict) and isinstance(product.get(key),Dict):
-                    product[key].update(value)
-                else:
-                    product[key]=value
-            products[index]=product
+    update_data=update_to_storage(update_data)
+    with write_lock():
+        products=_begin_write()
+        for index,product in enumerate(products):
+            if product["id"]==product_id:
+                before=deepcopy(product)
+                products[index]=_apply_update(product,update_data)
+                save_product(products)
+                _record("update",product_id,before,product)
+                return product
+        raise ValueError("product not found")
+
+##bulk update
+def change_products(updates: Dict[str,Dict])->List[Dict]:
+    """Apply {product_id: update_data} in one load and one write.
+
+    Ids that are no longer in the catalog are skipped, so a batch job that
+    scanned an older snapshot never resurrects a product deleted meanwhile.
+    """
+    with write_lock():
+        products=_begin_write()
+        changed=[]
+        for product in products:
+            update_data=updates.get(product["id"])
+            if update_data is None:
+                continue
+            before=deepcopy(product)
+            changed.append((before,_apply_update(product,update_data)))
+        if changed:
             save_product(products)
-            return product
-        raise ValueError("product not found")
\ No newline at end of file
+            _record_updates(changed)
+        return [product for _,product in changed]
+
+def _match_products(products: List[Dict],criteria: Dict)->np.ndarray:
+    mask=np.ones(len(products),dtype=bool)
+    for key,field in (("category","category"),("brand","brand")):
+        if criteria.get(key) is not None:
+            values=np.array([str(p.get(field,"")).lower() for p in products],dtype=object)
+            mask&=values==criteria[key].lower()
+    if criteria.get("seller_id") is not None:
+        sellers=np.array([(p.get("seller") or {}).get("seller_id") for p in products],dtype=object)
+        mask&=sellers==str(criteria["seller_id"])
+    if criteria.get("tag") is not None:
+        tag=criteria["tag"].lower()
+        mask&=np.array([tag in (t.lower() for t in (p.get("tags") or [])) for p in products],dtype=bool)
+    prices=np.array([p.get("price",0) for p in products],dtype=np.float64)
+    if criteria.get("min_price") is not None:
+        mask&=prices>=criteria["min_price"]
+    if criteria.get("max_price") is not None:
+        mask&=prices<=criteria["max_price"]
+    return mask
+
+##bulk price/discount update
+def bulk_update_products(criteria: Dict,operation: Dict,sample_size:int=10)->Dict:
+    """Apply one price/discount/is_active operation to every product matching `criteria`.
+
+    The new values and the Product business rules are evaluated for the whole
+    matched set as arrays; if any product would break a rule nothing is
+    written. Otherwise the catalog is saved once. Returns the matched and
+    updated counts plus the first `sample_size` updated products, so a
+    catalog-wide change does not echo the whole catalog back.
+    """
+    with write_lock():
+        products=_begin_write()
+        matched=np.nonzero(_match_products(products,criteria))[0] if products else np.array([],dtype=np.int64)
+        targets=[products[i] for i in matched]
+        price=np.array([p.get("price",0) for p in targets],dtype=np.float64)
+        discount=np.array([p.get("discount_percent",0) for p in targets],dtype=np.int64)
+        active=np.array([bool(p.get("is_active")) for p in targets],dtype=bool)
+        stock=np.array([p.get("stock",0) for p in targets],dtype=np.int64)
+        rating=np.array([p.get("rating",0) for p in targets],dtype=np.float64)
+
+        if operation.get("set_price") is not None:
+            price=np.full(len(targets),float(operation["set_price"]))
+        elif operation.get("scale_price") is not None:
+            price=np.round(price*operation["scale_price"],2)
+        if operation.get("discount_percent") is not None:
+            discount=np.full(len(targets),int(operation["discount_percent"]))
+        if operation.get("is_active") is not None:
+            active=np.full(len(targets),bool(operation["is_active"]))
+
+        # same rules as Product.validate_business_rules, plus price > 0
+        problems=(
+            ("price must be greater than 0",price<=0),
+            ("If stock is 0, is_active must be False",(stock==0)&active),
+            ("Discounted product must have a rating",(discount>0)&(rating==0)),
+        )
+        for message,broken in problems:
+            if broken.any():
+                ids=[targets[i]["id"] for i in np.nonzero(broken)[0][:5]]
+                raise ValueError(f"{message}: {int(broken.sum())} matched products, e.g. {', '.join(ids)}")
+
+        changed=[]
+        for i,product in enumerate(targets):
+            update_data={
+                "price":float(price[i]),
+                "discount_percent":int(discount[i]),
+                "is_active":bool(active[i]),
+            }
+            if all(product.get(k)==v for k,v in update_data.items()):
+                continue
+            before=deepcopy(product)
+            changed.append((before,_apply_update(product,update_data)))
+        if changed:
+            save_product(products)
+            _record_updates(changed)
+
+        return {
+            "matched":len(targets),
+            "updated":len(changed),
+            "sample":[
+                {k:p.get(k) for k in ("id","name","price","discount_percent","is_active","final_price")}
+                for _,p in changed[:sample_size]
+            ],
+        }
+
+def _version_of(path: Path)->tuple:
+    try:
+        stat=path.stat()
+    except FileNotFoundError:
+        return (0,0,0)
+    return (stat.st_ino,stat.st_mtime_ns,stat.st_size)
+
+def get_catalog_version()->tuple:
+    # changes whenever products.json is rewritten, by this process or another;
+    # save_product swaps in a new file, so the inode moves on every write
+    return _version_of(DATA_FILE)
@@ -0,0 +1,157 @@
+import cProfile
+import heapq
+import io
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class RequestProfile:
+    __slots__ = ("id", "method", "path", "query", "started", "total", "phases", "profiler", "_lock")
+
+    def __init__(self, profile_id: str, method: str, path: str, query: str):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.query = query
+        self.started = time.time()
+        self.total = 0.0
+        self.phases: Dict[str, float] = {}
+        self.profiler = cProfile.Profile()
+        self._lock = threading.Lock()
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+# set by ProfilingMiddleware for the requests it decided to profile
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+def start_profile(profile: RequestProfile):
+    return _current.set(profile)
+
+
+def stop_profile(token) -> None:
+    _current.reset(token)
+
+
+@contextmanager
+def phase(name: str):
+    """Time a named phase (load, scan, sort, ...) of a profiled request.
+
+    A no-op costing one context lookup when the request is not profiled.
+    """
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_phase(name, time.perf_counter() - start)
+
+
+def profiled(fn):
+    """Run a sync route handler under cProfile when its request is profiled.
+
+    cProfile only sees the thread it is enabled on, so it has to be switched
+    on here, inside the threadpool worker that runs the handler.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return profile.profiler.runcall(fn, *args, **kwargs)
+        finally:
+            profile.add_phase("handler", time.perf_counter() - start)
+    return wrapper
+
+
+class ProfileStore:
+    """Size-bounded rotation of .prof dumps plus a list of the slowest requests.
+
+    Dumps are regular pstats files (`python -m pstats <file>`, snakeviz, ...).
+    The oldest dumps are deleted once either `max_files` or `max_bytes` is
+    exceeded; the summary keeps the `keep_slowest` slowest requests seen.
+    """
+
+    def __init__(self, directory: Path, max_files: int = 50, max_bytes: int = 50 * 1024 * 1024, keep_slowest: int = 20):
+        self.directory = Path(directory)
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.keep_slowest = keep_slowest
+        self._slowest: List = []
+        self._lock = threading.Lock()
+
+    def save(self, profile: RequestProfile) -> Dict:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{profile.id}.prof"
+        profile.profiler.dump_stats(str(path))
+
+        phases = dict(profile.phases)
+        # whatever the handler did not account for: routing, validation, serialisation
+        phases["serialize"] = max(profile.total - phases.get("handler", 0.0), 0.0)
+        summary = {
+            "id": profile.id,
+            "file": path.name,
+            "method": profile.method,
+            "path": profile.path,
+            "query": profile.query,
+            "started": profile.started,
+            "total_ms": round(profile.total * 1000, 3),
+            "phases_ms": {k: round(v * 1000, 3) for k, v in phases.items()},
+            "top_functions": self._top_functions(profile.profiler),
+        }
+        with self._lock:
+            entry = (profile.total, profile.id, summary)
+            if len(self._slowest) < self.keep_slowest:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+            self._rotate()
+        return summary
+
+    @staticmethod
+    def _top_functions(profiler: cProfile.Profile, limit: int = 10) -> List[Dict]:
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        rows = []
+        for (filename, line, func), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": f"{Path(filename).name}:{line}({func})",
+                "calls": calls,
+                "tottime_ms": round(tottime * 1000, 3),
+                "cumtime_ms": round(cumtime * 1000, 3),
+            })
+        rows.sort(key=lambda r: r["cumtime_ms"], reverse=True)
+        return rows[:limit]
+
+    def _rotate(self) -> None:
+        dumps = sorted(self.directory.glob("*.prof"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in dumps)
+        while dumps and (len(dumps) > self.max_files or total > self.max_bytes):
+            oldest = dumps.pop(0)
+            total -= oldest.stat().st_size
+            oldest.unlink(missing_ok=True)
+        kept = {p.name for p in dumps}
+        for entry in self._slowest:
+            if entry[2]["file"] not in kept:
+                entry[2]["file"] = None
+
+    def slowest(self) -> List[Dict]:
+        with self._lock:
+            return [entry[2] for entry in sorted(self._slowest, key=lambda e: e[0], reverse=True)]
@@ -0,0 +1,72 @@
+from typing import Dict, List, Optional, Tuple
+
+# named field sets; "card" is exactly what the Streamlit listing card renders
+FIELD_PRESETS = {
+    "card": (
+        "id",
+        "name",
+        "brand",
+        "category",
+        "rating",
+        "price",
+        "discount_percent",
+        "stock",
+        "tags",
+        "image_urls",
+    ),
+}
+
+# the card only shows the first image, so its projection drops the rest
+TRIMMED_LISTS = {
+    "card": {"image_urls": 1},
+}
+
+PRODUCT_FIELDS = frozenset({
+    "id", "sku", "name", "description", "category", "brand", "price",
+    "currency", "discount_percent", "final_price", "stock", "is_active",
+    "rating", "tags", "image_urls", "dimensions_cm", "seller", "created_at",
+})
+
+FieldSet = Tuple[str, ...]
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[Optional[str], FieldSet]]:
+    """Turn a `fields=` query value into (preset name, field names).
+
+    Accepts a preset name (`card`) or a comma separated list of top level
+    product fields; the preset name is None for an explicit list and picks
+    the list trimming in TRIMMED_LISTS otherwise. `id` is always kept so
+    clients can address the item. Returns None when no projection was asked for.
+    """
+    if fields is None or not fields.strip():
+        return None
+    key = fields.strip().lower()
+    if key in FIELD_PRESETS:
+        return key, FIELD_PRESETS[key]
+
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = sorted(set(names) - PRODUCT_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    if "id" not in names:
+        names.insert(0, "id")
+    return None, tuple(dict.fromkeys(names))
+
+
+def project(product: Dict, field_set: FieldSet, trim: Optional[Dict[str, int]] = None) -> Dict:
+    projected = {}
+    for name in field_set:
+        if name not in product:
+            continue
+        value = product[name]
+        if trim and name in trim and isinstance(value, list):
+            value = value[:trim[name]]
+        projected[name] = value
+    return projected
+
+
+def apply_fields(products: List[Dict], parsed: Tuple[Optional[str], FieldSet]) -> List[Dict]:
+    """Project a page of products; only the returned page is ever projected."""
+    preset, field_set = parsed
+    trim = TRIMMED_LISTS.get(preset)
+    return [project(p, field_set, trim) for p in products]
@@ -0,0 +1,133 @@
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+from service.changes import Change, change_log
+from service.codec import ProductRecord, final_price
+from service.products import get_catalog_version, load_records, write_lock
+
+# same threshold as get_stock_status in app.py ("Only N left!")
+LOW_STOCK = 10
+
+
+def discount_bucket(discount: int) -> str:
+    if not discount:
+        return "0"
+    low = (discount - 1) // 10 * 10 + 1
+    return f"{low}-{low + 9}"
+
+
+class SellerStats:
+    __slots__ = ("seller_id", "name", "email", "products", "active", "stock_value", "rating_sum", "discounts", "low_stock")
+
+    def __init__(self, seller_id: str):
+        self.seller_id = seller_id
+        self.name = None
+        self.email = None
+        self.products: Dict[str, ProductRecord] = {}
+        self.active = 0
+        self.stock_value = 0.0
+        self.rating_sum = 0.0
+        self.discounts: Counter = Counter()
+        self.low_stock: Dict[str, ProductRecord] = {}
+
+    def add(self, record: ProductRecord, sign: int) -> None:
+        self.active += sign * bool(record.is_active)
+        self.stock_value += sign * record.stock * final_price(record.price, record.discount_percent)
+        self.rating_sum += sign * record.rating
+        self.discounts[discount_bucket(record.discount_percent)] += sign
+        if sign > 0:
+            self.products[record.id] = record
+            if record.stock < LOW_STOCK:
+                self.low_stock[record.id] = record
+            self.name, self.email = record.seller.name, record.seller.email
+        else:
+            self.products.pop(record.id, None)
+            self.low_stock.pop(record.id, None)
+
+    def summary(self) -> Dict:
+        count = len(self.products)
+        return {
+            "seller_id": self.seller_id,
+            "name": self.name,
+            "email": self.email,
+            "product_count": count,
+            "active_count": self.active,
+            "total_stock_value": round(self.stock_value, 2),
+            "average_rating": round(self.rating_sum / count, 2) if count else None,
+            "discount_distribution": {k: v for k, v in sorted(self.discounts.items()) if v},
+            "low_stock": [
+                {"id": r.id, "name": r.name, "stock": r.stock}
+                for r in sorted(self.low_stock.values(), key=lambda r: r.stock)
+            ],
+        }
+
+
+class SellerIndex:
+    """Per-seller product index with running aggregates.
+
+    Built once from the catalog, then kept current by applying each write
+    from the change log as "remove old version, add new version", so the
+    seller endpoints never scan the catalog. Writes made by another process
+    are noticed through the catalog version and cause a rebuild.
+    """
+
+    def __init__(self):
+        self._sellers: Dict[str, SellerStats] = {}
+        self._version = None
+        self._lock = threading.RLock()
+
+    def _rebuild(self) -> None:
+        self._sellers = {}
+        for record in load_records():
+            self._add(record, 1)
+        self._version = get_catalog_version()
+
+    def _add(self, record: ProductRecord, sign: int) -> None:
+        if record.seller is None or record.seller.seller_id is None:
+            return
+        seller_id = str(record.seller.seller_id)
+        stats = self._sellers.get(seller_id)
+        if stats is None:
+            stats = self._sellers[seller_id] = SellerStats(seller_id)
+        stats.add(record, sign)
+        if not stats.products:
+            del self._sellers[seller_id]
+
+    def on_change(self, changes: List[Change]) -> None:
+        with self._lock:
+            if self._version is None:
+                return
+            for _, before, after in changes:
+                if before is not None:
+                    self._add(ProductRecord.from_dict(before), -1)
+                if after is not None:
+                    self._add(ProductRecord.from_dict(after), 1)
+            self._version = get_catalog_version()
+
+    def _ensure_current(self) -> None:
+        if self._version == get_catalog_version():
+            return
+        # a write of our own may be between saving and on_change: rebuilding from
+        # its file now would have on_change apply it a second time, so wait it out.
+        # write_lock before self._lock, the same order as a writer calling on_change
+        with write_lock():
+            with self._lock:
+                if self._version != get_catalog_version():
+                    self._rebuild()
+
+    def summary(self, seller_id: str) -> Optional[Dict]:
+        self._ensure_current()
+        with self._lock:
+            stats = self._sellers.get(seller_id)
+            return stats.summary() if stats else None
+
+    def products(self, seller_id: str) -> Optional[List[ProductRecord]]:
+        self._ensure_current()
+        with self._lock:
+            stats = self._sellers.get(seller_id)
+            return list(stats.products.values()) if stats else None
+
+
+seller_index = SellerIndex()
+change_log.subscribe(seller_index.on_change)
@@ -0,0 +1,253 @@
+import atexit
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from service.changes import Change, change_log
+from service.products import get_catalog_version, get_product, load_records
+
+
+def shard_of(key: Optional[str], count: int) -> int:
+    # crc32 rather than hash(): it has to agree across worker processes
+    return zlib.crc32((key or "").encode("utf-8")) % count
+
+
+# what a shard keeps per product: just enough to filter and order a page
+#   (id, lowercased name, price, position in products.json)
+Row = Tuple[str, str, float, int]
+
+
+def _query_shard(rows: Dict[str, Row], needle: Optional[str], sort_by_price: bool, order: str, top_n: int):
+    matches = rows.values()
+    if needle:
+        matches = [row for row in matches if needle in row[1]]
+    if sort_by_price:
+        sign = -1 if order == "desc" else 1
+        keyed = heapq.nsmallest(top_n, (((sign * price, pos), pid) for pid, _, price, pos in matches))
+    else:
+        keyed = heapq.nsmallest(top_n, (((pos,), pid) for pid, _, _, pos in matches))
+    return len(matches), keyed
+
+
+def _shard_worker(conn) -> None:
+    rows: Dict[str, Row] = {}
+    while True:
+        message = conn.recv()
+        if message is None:
+            return
+        req_id, command, args = message
+        try:
+            if command == "load":
+                rows = {row[0]: row for row in args[0]}
+                result = len(rows)
+            elif command == "apply":
+                puts, drops = args
+                for product_id in drops:
+                    rows.pop(product_id, None)
+                for row in puts:
+                    rows[row[0]] = row
+                result = len(rows)
+            else:
+                result = _query_shard(rows, *args)
+            conn.send((req_id, True, result))
+        except Exception as e:
+            conn.send((req_id, False, repr(e)))
+
+
+class _Shard:
+    def __init__(self, ctx, index: int):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_shard_worker,
+            args=(child,),
+            name=f"catalog-shard-{index}",
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self._ids = itertools.count()
+        self._pending: Dict[int, Future] = {}
+        self._send_lock = threading.Lock()
+        threading.Thread(target=self._read_replies, daemon=True).start()
+
+    def call(self, command: str, *args) -> Future:
+        future = Future()
+        with self._send_lock:
+            req_id = next(self._ids)
+            self._pending[req_id] = future
+            self.conn.send((req_id, command, args))
+        return future
+
+    def _read_replies(self) -> None:
+        while True:
+            try:
+                req_id, ok, result = self.conn.recv()
+            except (EOFError, OSError):
+                for future in self._pending.values():
+                    future.set_exception(RuntimeError("catalog shard worker exited"))
+                self._pending.clear()
+                return
+            future = self._pending.pop(req_id)
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(result))
+
+    def close(self) -> None:
+        try:
+            with self._send_lock:
+                self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=1)
+
+
+class ShardedCatalog:
+    """Catalog split across worker processes for parallel scatter-gather queries.
+
+    Each worker owns the products of its shard (by category or by a hash of
+    the id) as compact (id, name, price, position) rows handed to it by this
+    process, which already has the decoded catalog. A list/search/sort query
+    is sent to every shard at once; each returns its match count and the sort
+    keys and ids of its first `offset + limit` matches, the coordinator k-way
+    merges those runs and builds the requested page from its own records.
+
+    Writes through the products service reach the shards as deltas from the
+    change log. Only a catalog rewritten by another process, or a worker
+    that exited and had to be respawned, makes the coordinator send every
+    shard its rows again.
+    """
+
+    def __init__(self, count: int, shard_by: str = "hash"):
+        if shard_by not in ("hash", "category"):
+            raise ValueError(f"unknown shard key: {shard_by}")
+        self.count = count
+        self.shard_by = shard_by
+        self._shards: List[_Shard] = []
+        self._version = None
+        self._epoch = None
+        # product id -> (shard, position); positions keep unsorted pages in file order
+        self._placement: Dict[str, Tuple[int, int]] = {}
+        self._next_pos = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["ShardedCatalog"]:
+        count = int(os.getenv("CATALOG_SHARDS", "0"))
+        if count <= 1:
+            return None
+        return cls(count, os.getenv("CATALOG_SHARD_BY", "hash"))
+
+    def _shard_for(self, product) -> int:
+        if isinstance(product, dict):
+            key = product.get("category") if self.shard_by == "category" else product["id"]
+        else:
+            key = product.category if self.shard_by == "category" else product.id
+        return shard_of(key, self.count)
+
+    def _fresh(self) -> bool:
+        return self._version == get_catalog_version() and self._epoch == change_log.epoch
+
+    def _alive(self) -> bool:
+        return bool(self._shards) and all(shard.process.is_alive() for shard in self._shards)
+
+    def _ensure_loaded(self) -> None:
+        if self._fresh() and self._alive():
+            return
+        with self._lock:
+            if self._fresh() and self._alive():
+                return
+            # spawn, not fork: the API process is multi-threaded
+            ctx = multiprocessing.get_context("spawn")
+            if not self._shards:
+                self._shards = [_Shard(ctx, i) for i in range(self.count)]
+                atexit.register(self.close)
+            for i, shard in enumerate(self._shards):
+                if not shard.process.is_alive():
+                    # a respawned worker starts empty, so every shard gets its rows again
+                    shard.close()
+                    self._shards[i] = _Shard(ctx, i)
+                    self._version = None
+            version, epoch = get_catalog_version(), change_log.epoch
+            partitions: List[List[Row]] = [[] for _ in self._shards]
+            self._placement = {}
+            for pos, r in enumerate(load_records()):
+                index = self._shard_for(r)
+                partitions[index].append((r.id, r.name.lower(), r.price, pos))
+                self._placement[r.id] = (index, pos)
+            self._next_pos = len(self._placement)
+            futures = [shard.call("load", rows) for shard, rows in zip(self._shards, partitions)]
+            for future in futures:
+                future.result()
+            self._version, self._epoch = version, epoch
+
+    def on_change(self, changes: List[Change]) -> None:
+        with self._lock:
+            if self._version is None:
+                return
+            puts: Dict[int, List[Row]] = {}
+            drops: Dict[int, List[str]] = {}
+            for op, before, after in changes:
+                product_id = (after or before)["id"]
+                placed = self._placement.pop(product_id, None)
+                if placed is not None:
+                    drops.setdefault(placed[0], []).append(product_id)
+                if after is None:
+                    continue
+                if placed is not None:
+                    pos = placed[1]
+                else:
+                    pos, self._next_pos = self._next_pos, self._next_pos + 1
+                index = self._shard_for(after)
+                # a put wins over the drop above when the product stays on its shard
+                puts.setdefault(index, []).append((product_id, after.get("name", "").lower(), after.get("price", 0), pos))
+                self._placement[product_id] = (index, pos)
+            try:
+                futures = [
+                    shard.call("apply", puts.get(i, []), drops.get(i, []))
+                    for i, shard in enumerate(self._shards)
+                    if i in puts or i in drops
+                ]
+                for future in futures:
+                    future.result()
+            except (OSError, RuntimeError):
+                # a worker died: the write itself is saved, so just reload on the next query
+                self._version = None
+                return
+            self._version = get_catalog_version()
+
+    def _scatter(self, *args) -> List:
+        self._ensure_loaded()
+        futures = [shard.call("query", *args) for shard in self._shards]
+        return [future.result() for future in futures]
+
+    def query(self, needle: Optional[str], sort_by_price: bool, order: str, offset: int, limit: int) -> Tuple[int, List[Dict]]:
+        try:
+            results = self._scatter(needle, sort_by_price, order, offset + limit)
+        except (OSError, RuntimeError):
+            # a worker died mid-query; the retry respawns and reloads it
+            results = self._scatter(needle, sort_by_price, order, offset + limit)
+        total = sum(count for count, _ in results)
+        merged = heapq.merge(*(run for _, run in results), key=lambda item: item[0])
+        page = []
+        for _, product_id in itertools.islice(merged, offset, offset + limit):
+            record = get_product(product_id)
+            if record is not None:
+                page.append(record.to_dict())
+        return total, page
+
+    def close(self) -> None:
+        for shard in self._shards:
+            shard.close()
+        self._shards = []
+        self._version = None
+
+
+sharded_catalog = ShardedCatalog.from_env()
+if sharded_catalog is not None:
+    change_log.subscribe(sharded_catalog.on_change)
@@ -0,0 +1,359 @@
+import logging
+import math
+import threading
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from service.changes import Change, change_log
+from service.products import get_catalog_version, load_products, write_lock
+
+logger = logging.getLogger(__name__)
+
+# how much each signal counts towards cosine similarity
+CATEGORY_WEIGHT = 3.0
+BRAND_WEIGHT = 2.0
+TAGS_WEIGHT = 1.5
+PRICE_WEIGHT = 2.0
+RATING_WEIGHT = 1.0
+
+PRICE_BANDS = 8
+
+# price bands and rating come first so category/brand/tag columns can be
+# appended when a write brings in a value the index has not seen yet
+RATING_COL = PRICE_BANDS
+VOCAB_OFFSET = PRICE_BANDS + 1
+
+
+class IndexNotReady(Exception):
+    """Raised by lookups while the first build of the index is still running."""
+
+
+class _Neighbours:
+    """Feature matrix and top-k neighbour table for one catalog snapshot.
+
+    Not thread safe; SimilarityIndex serialises access to it.
+    """
+
+    def __init__(self, k: int, batch_bytes: int, products: List[Dict]):
+        self.k = k
+        self.batch_bytes = batch_bytes
+        self.version = None
+        self.epoch = None
+        # rows whose own features changed and whose effect on others is not yet worked out
+        self.pending: Set[int] = set()
+        # rows whose neighbour list may be out of date
+        self.stale: Set[int] = set()
+
+        prices = np.array([p.get("price", 0) for p in products if p.get("price", 0) > 0], dtype=np.float64)
+        if len(prices):
+            self._price_edges = np.quantile(np.log(prices), np.linspace(0, 1, PRICE_BANDS + 1)[1:-1])
+        else:
+            self._price_edges = np.zeros(PRICE_BANDS - 1)
+
+        vocab = sorted({key for p in products for key in self._keys(p)})
+        self._columns = {key: VOCAB_OFFSET + i for i, key in enumerate(vocab)}
+
+        n = len(products)
+        self._ids: List[str] = [p["id"] for p in products]
+        self._rows: Dict[str, int] = {pid: i for i, pid in enumerate(self._ids)}
+        self._products: Dict[str, Dict] = {p["id"]: p for p in products}
+        self._features = np.zeros((max(n, 1), VOCAB_OFFSET + len(vocab)), dtype=np.float32)
+        for i, product in enumerate(products):
+            self._set_features(i, product)
+        self._live = np.zeros(max(n, 1), dtype=bool)
+        self._live[:n] = [bool(p.get("is_active", True)) for p in products]
+        self._neighbors = np.full((max(n, 1), k), -1, dtype=np.int64)
+        self._scores = np.full((max(n, 1), k), -np.inf, dtype=np.float32)
+        self.refresh_rows(range(n))
+
+    #  FEATURES  #
+
+    @staticmethod
+    def _keys(product: Dict) -> List[Tuple[str, str]]:
+        keys = [("c", product.get("category", "")), ("b", product.get("brand", ""))]
+        keys += [("t", t) for t in (product.get("tags") or [])]
+        return keys
+
+    def _column(self, key: Tuple[str, str]) -> int:
+        column = self._columns.get(key)
+        if column is None:
+            column = self._columns[key] = VOCAB_OFFSET + len(self._columns)
+            width = self._features.shape[1]
+            if column >= width:
+                # an all-zero column changes no dot product, so growing is safe
+                grown = np.zeros((len(self._features), max(column + 1, 2 * width)), dtype=np.float32)
+                grown[:, :width] = self._features
+                self._features = grown
+        return column
+
+    def _set_features(self, row: int, product: Dict) -> None:
+        columns = [(self._column(key), key[0]) for key in self._keys(product)]
+        vector = self._features[row]
+        vector[:] = 0
+        tags = product.get("tags") or []
+        for column, kind in columns:
+            if kind == "c":
+                vector[column] = CATEGORY_WEIGHT
+            elif kind == "b":
+                vector[column] = BRAND_WEIGHT
+            else:
+                vector[column] = TAGS_WEIGHT / math.sqrt(len(tags))
+        price = product.get("price", 0)
+        band = int(np.searchsorted(self._price_edges, math.log(price))) if price > 0 else 0
+        # neighbouring bands get half credit so 19k and 21k still look alike
+        for offset, weight in ((0, 1.0), (-1, 0.5), (1, 0.5)):
+            if 0 <= band + offset < PRICE_BANDS:
+                vector[band + offset] = PRICE_WEIGHT * weight
+        vector[RATING_COL] = RATING_WEIGHT * product.get("rating", 0) / 5
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+
+    def _grow(self, size: int) -> None:
+        capacity = len(self._live)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+
+        def grown(array, fill):
+            new = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            new[:len(array)] = array
+            return new
+
+        self._features = grown(self._features, 0)
+        self._live = grown(self._live, False)
+        self._neighbors = grown(self._neighbors, -1)
+        self._scores = grown(self._scores, -np.inf)
+
+    def apply(self, op: str, before: Optional[Dict], after: Optional[Dict]) -> Optional[int]:
+        """Write one change into the feature rows; the neighbour lists are left alone."""
+        product_id = (after or before)["id"]
+        row = self._rows.get(product_id)
+        if op == "delete":
+            if row is None:
+                return None
+            self._products.pop(product_id, None)
+            self._live[row] = False
+            self._features[row] = 0
+        else:
+            if row is None:
+                row = len(self._ids)
+                self._grow(row + 1)
+                self._ids.append(product_id)
+                self._rows[product_id] = row
+            self._products[product_id] = after
+            self._set_features(row, after)
+            self._live[row] = bool(after.get("is_active", True))
+        self.pending.add(row)
+        self.stale.add(row)
+        return row
+
+    #  NEIGHBOURS  #
+
+    def batch_rows(self) -> int:
+        # each batch materialises a rows x n float32 score matrix
+        return max(1, self.batch_bytes // (4 * max(len(self._ids), 1)))
+
+    def refresh_rows(self, rows: Sequence[int]) -> None:
+        n = len(self._ids)
+        rows = np.asarray(sorted(r for r in set(rows) if self._ids[r] in self._products), dtype=np.int64)
+        if not len(rows) or not n:
+            return
+        features = self._features[:n]
+        # inactive and deleted products are never recommended
+        blocked = ~self._live[:n]
+        k = min(self.k, n)
+        step = self.batch_rows()
+        for start in range(0, len(rows), step):
+            batch = rows[start:start + step]
+            scores = features[batch] @ features.T
+            scores[:, blocked] = -np.inf
+            scores[np.arange(len(batch)), batch] = -np.inf
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            top[~np.isfinite(top_scores)] = -1
+            self._neighbors[batch, :k] = top
+            self._scores[batch, :k] = top_scores
+
+    def affected_by(self, changed: Sequence[int]) -> Set[int]:
+        """Rows whose neighbour lists the changed rows can alter."""
+        n = len(self._ids)
+        changed = np.asarray(changed, dtype=np.int64)
+        affected = set(changed.tolist())
+        # rows that listed a changed product may now rank it lower or not at all
+        affected.update(np.nonzero(np.isin(self._neighbors[:n], changed).any(axis=1))[0].tolist())
+        # rows for which a changed product now beats their current k-th neighbour
+        live_changed = changed[self._live[changed]]
+        if len(live_changed):
+            scores = self._features[:n] @ self._features[live_changed].T
+            kth = self._scores[:n, min(self.k, n) - 1]
+            affected.update(np.nonzero((scores > kth[:, None]).any(axis=1))[0].tolist())
+        return affected
+
+    def lookup(self, product_id: str, k: int) -> Optional[List[Tuple[Dict, float]]]:
+        row = self._rows.get(product_id)
+        if row is None or product_id not in self._products:
+            return None
+        neighbors = self._neighbors[row, :k]
+        # one row is a single 1 x n product, cheap enough to fix on the spot
+        if row in self.stale or not self._live[neighbors[neighbors >= 0]].all():
+            self.refresh_rows([row])
+            self.stale.discard(row)
+        result = []
+        for neighbor, score in zip(self._neighbors[row, :k], self._scores[row, :k]):
+            if neighbor < 0:
+                break
+            result.append((self._products[self._ids[neighbor]], round(float(score), 4)))
+        return result
+
+
+class SimilarityIndex:
+    """Precomputed "you may also like" neighbours for every product.
+
+    Each product becomes one row of a feature matrix (soft one-hot log price
+    band, rating, one-hot category and brand, multi-hot tags), rows are L2
+    normalised, and the top `k` cosine neighbours of every row are found in
+    batched matrix products. Lookups are a dict hit plus an array slice.
+
+    Writes through the products service only update the feature rows of the
+    products they touched (adding vocabulary columns as needed); a background
+    thread then recomputes the neighbour lists those rows can affect, and a
+    lookup of a row still waiting for that fixes just that row. A catalog
+    rewritten by another process is rebuilt in the background while the old
+    index keeps serving. The first build also runs in the background (call
+    `start()` at startup); until it is done lookups raise IndexNotReady.
+    """
+
+    def __init__(self, k: int = 20, batch_bytes: int = 64 << 20):
+        self.k = k
+        # upper bound for one batch's score matrix, so batches shrink as the catalog grows
+        self.batch_bytes = batch_bytes
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._state: Optional[_Neighbours] = None
+        # changes made while a rebuild is loading, replayed onto the new index
+        self._backlog: Optional[List[Change]] = None
+        self._backlog_version = None
+        self._wakeup = threading.Event()
+        self._worker = None
+
+    def _fresh(self, state: _Neighbours) -> bool:
+        return state.version == get_catalog_version() and state.epoch == change_log.epoch
+
+    def start(self) -> None:
+        """Build the index in the background, if it is not built or building already."""
+        self._wake()
+
+    def _wake(self) -> None:
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="similarity-refresh", daemon=True)
+                self._worker.start()
+        self._wakeup.set()
+
+    #  BUILD  #
+
+    def _rebuild(self) -> None:
+        with self._build_lock:
+            with self._lock:
+                if self._state is not None and self._fresh(self._state):
+                    return
+                self._backlog = []
+            version, epoch = get_catalog_version(), change_log.epoch
+            try:
+                state = _Neighbours(self.k, self.batch_bytes, load_products())
+            except BaseException:
+                with self._lock:
+                    self._backlog = None
+                raise
+            state.version, state.epoch = version, epoch
+            with self._lock:
+                # applying a change the snapshot already contains is harmless
+                for op, before, after in self._backlog:
+                    state.apply(op, before, after)
+                if self._backlog:
+                    state.version = self._backlog_version
+                self._backlog = None
+                self._state = state
+        if state.pending:
+            self._wake()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                state = self._state
+                if state is None:
+                    self._rebuild()
+                elif not self._fresh(state):
+                    # a write of our own may be between saving and on_change; wait it out
+                    with write_lock():
+                        stale = not self._fresh(state)
+                    if stale:
+                        self._rebuild()
+                self._drain()
+            except Exception:
+                # keep serving the current index; the next write or lookup retries
+                logger.exception("similarity index refresh failed")
+
+    def _drain(self) -> None:
+        with self._lock:
+            state = self._state
+            if state is None or not state.pending:
+                return
+            changed, state.pending = sorted(state.pending), set()
+        step = state.batch_rows()
+        affected: Set[int] = set()
+        for start in range(0, len(changed), step):
+            with self._lock:
+                if state is not self._state:
+                    return
+                affected |= state.affected_by(changed[start:start + step])
+        affected = sorted(affected)
+        with self._lock:
+            state.stale.update(affected)
+        for start in range(0, len(affected), step):
+            with self._lock:
+                if state is not self._state:
+                    return
+                batch = [r for r in affected[start:start + step] if r in state.stale]
+                state.refresh_rows(batch)
+                state.stale.difference_update(batch)
+
+    #  INCREMENTAL  #
+
+    def on_change(self, changes: List[Change]) -> None:
+        with self._lock:
+            if self._backlog is not None:
+                self._backlog.extend(changes)
+                self._backlog_version = get_catalog_version()
+            state = self._state
+            if state is None:
+                return
+            for op, before, after in changes:
+                state.apply(op, before, after)
+            state.version = get_catalog_version()
+        self._wake()
+
+    #  LOOKUP  #
+
+    def similar(self, product_id: str, k: int = 5) -> Optional[List[Tuple[Dict, float]]]:
+        with self._lock:
+            state = self._state
+        if state is None:
+            # never build inline: that is O(n^2) work on a request thread
+            self.start()
+            raise IndexNotReady("similar products are still being indexed")
+        if not self._fresh(state):
+            self._wake()
+        with self._lock:
+            return self._state.lookup(product_id, k)
+
+
+similar_products = SimilarityIndex()
+change_log.subscribe(similar_products.on_change)
@@ -1,9 +1,8 @@
-import json
+import argparse
 import random
+from typing import Dict, Optional
 
-# Load the products
-with open('data/products.json', 'r', encoding='utf-8') as f:
-    products = json.load(f)
+from service.batch import run_batch_job
 
 # Extensive image library with unique images for each brand and category
 laptop_images = [
@@ -75,36 +74,41 @@ category_images = {
     'tablets': tablet_images
 }
 
-# Track used images to maximize variety
-used_images = set()
 
-# Update each product with unique images
-for idx, product in enumerate(products):
+def pick_images(product: Dict, rng: random.Random) -> Optional[Dict]:
     category = product.get('category', 'electronics')
-    
+
     # Get the appropriate image pool for this category
     image_pool = category_images.get(category, electronics_images)
-    
-    # Create a pool of available images (not yet used for this product)
-    available_images = [img for img in image_pool if img not in used_images]
-    
-    # If we've used most images, reset the used set but keep some variety
-    if len(available_images) < 2:
-        used_images.clear()
-        available_images = image_pool.copy()
-    
+
     # Randomly select 2-3 unique images for this product
-    num_images = random.choice([2, 3])
-    selected_images = random.sample(available_images, min(num_images, len(available_images)))
-    
-    product['image_urls'] = selected_images
-    
-    # Mark these images as used (to avoid immediate repetition)
-    for img in selected_images[:1]:  # Only mark first image to allow some reuse
-        used_images.add(img)
-
-# Save updated products
-with open('data/products.json', 'w', encoding='utf-8') as f:
-    json.dump(products, f, indent=2, ensure_ascii=False)
-
-print(f"✅ Updated images for {len(products)} products!")
+    num_images = rng.choice([2, 3])
+    selected_images = rng.sample(list(dict.fromkeys(image_pool)), num_images)
+
+    return {'image_urls': selected_images}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reassign product image_urls from the category image pools")
+    parser.add_argument('--seed', type=int, default=None, help="seed for reproducible picks (same seed, same images)")
+    parser.add_argument('--dry-run', action='store_true', help="report what would change without writing")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=500, help="products per worker task")
+    args = parser.parse_args()
+
+    result = run_batch_job(
+        pick_images,
+        seed=args.seed,
+        dry_run=args.dry_run,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+    )
+
+    if args.dry_run:
+        print(f"🔎 Dry run: {result['changed']} of {result['scanned']} products would get new images")
+    else:
+        print(f"✅ Updated images for {result['committed']} of {result['scanned']} products!")
+
+
+if __name__ == '__main__':
+    main()